@@ -4,97 +4,198 @@ Car2X Dashboard Web Application
 A modern web interface for V2X communication and vehicle management.
 """
 
+import os
+
+# Optional: load environment variables if a .env file is present
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except Exception:
+    pass
+
+# eventlet patches the standard library so that Socket.IO clients are served
+# by green threads instead of one OS thread per connection. Flask, Socket.IO
+# and paho are imported after the patch so they pick up the patched modules.
+SOCKETIO_ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE', 'eventlet')
+if SOCKETIO_ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+
 from flask import Flask, render_template, request, jsonify
+from flask.json.provider import JSONProvider
 from flask_socketio import SocketIO, emit
 import paho.mqtt.client as mqtt
 import json
 import threading
 import time
-from datetime import datetime
+import uuid
+from collections import deque
+from itertools import islice
 from typing import Dict, List, Any
-import os
 
-# Optional: load environment variables if a .env file is present
+# Optional: orjson is a much faster drop-in for the stdlib json module.
+# Both loads() accept bytes, so MQTT payloads never need decoding first.
 try:
-    from dotenv import load_dotenv
-    load_dotenv()
-except Exception:
-    pass
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    orjson = None
+    json_loads = json.loads
+    json_dumps = json.dumps
+
+class ORJSONProvider(JSONProvider):
+    """Flask JSON provider backed by orjson"""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+if orjson is not None:
+    app.json = ORJSONProvider(app)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'change-me')
 CORS_ALLOWED_ORIGINS = os.getenv('CORS_ALLOWED_ORIGINS', '*')
-socketio = SocketIO(app, cors_allowed_origins=CORS_ALLOWED_ORIGINS)
+socketio = SocketIO(app, async_mode=SOCKETIO_ASYNC_MODE, cors_allowed_origins=CORS_ALLOWED_ORIGINS)
 
 MQTT_BROKER_HOST = os.getenv('MQTT_BROKER_HOST', 'localhost')
 MQTT_BROKER_PORT = int(os.getenv('MQTT_BROKER_PORT', '1883'))
+# Minimum seconds between two vehicle_update emits for the same vehicle
+VEHICLE_UPDATE_INTERVAL = float(os.getenv('VEHICLE_UPDATE_INTERVAL', '0.2'))
+
+# Upper bounds for the in-memory history kept by the dashboard
+MAX_EMERGENCIES = 10000
+MAX_JOBS = 1000
+MAX_JOB_RESPONSES = 500
 
 class Car2XDashboard:
     def __init__(self):
         self.mqtt_client = mqtt.Client()
         self.vehicles = {}
         self.infrastructure = {}
-        self.emergencies = []
+        self.emergencies = deque(maxlen=MAX_EMERGENCIES)
         self.jobs = {}
+        # Last vehicle state sent to Socket.IO clients, used to emit deltas
+        self._last_emitted = {}
+        self._last_emit_time = {}
         self.setup_mqtt()
         
     def setup_mqtt(self):
         """Setup MQTT client for receiving V2X messages"""
         self.mqtt_client.on_connect = self.on_mqtt_connect
-        self.mqtt_client.on_message = self.on_mqtt_message
+        # Log and drop a message whose handler raises instead of letting the
+        # exception stop paho's network thread
+        self.mqtt_client.suppress_exceptions = True
+        self.mqtt_client.enable_logger()
+        # paho matches each topic filter itself and calls the handler
+        # directly, so no per-message topic parsing is needed here
+        self.mqtt_client.message_callback_add("v2x/vehicles/batch", self.on_vehicle_batch)
+        self.mqtt_client.message_callback_add("v2x/vehicles/+/status", self.on_vehicle_status)
+        self.mqtt_client.message_callback_add("v2x/vehicles/+/emergency", self.on_vehicle_emergency)
+        self.mqtt_client.message_callback_add("v2x/infrastructure/+", self.on_infrastructure_update)
+        self.mqtt_client.message_callback_add("v2x/emergency/broadcast", self.on_emergency_broadcast)
+        self.mqtt_client.message_callback_add("v2x/jobs/+/response", self.on_job_response)
         
     def on_mqtt_connect(self, client, userdata, flags, rc):
         print(f"MQTT Connected with result code {rc}")
         # Subscribe to all V2X topics
+        client.subscribe("v2x/vehicles/batch")
         client.subscribe("v2x/vehicles/+/status")
         client.subscribe("v2x/vehicles/+/emergency")
         client.subscribe("v2x/infrastructure/+")
         client.subscribe("v2x/emergency/broadcast")
         client.subscribe("v2x/jobs/+/response")
-        
-    def on_mqtt_message(self, client, userdata, msg):
+    
+    def parse_payload(self, msg):
+        """Decode a JSON MQTT payload, returning None if it is malformed"""
         try:
-            topic_parts = msg.topic.split('/')
-            message = json.loads(msg.payload.decode())
-            
-            if topic_parts[1] == "vehicles" and topic_parts[3] == "status":
-                # Vehicle status update
-                vehicle_id = topic_parts[2]
-                self.vehicles[vehicle_id] = message
-                socketio.emit('vehicle_update', message)
-                
-            elif topic_parts[1] == "vehicles" and topic_parts[3] == "emergency":
-                # Vehicle emergency
-                vehicle_id = topic_parts[2]
-                socketio.emit('vehicle_emergency', {
-                    'vehicle_id': vehicle_id,
-                    'message': message
-                })
-                
-            elif topic_parts[1] == "infrastructure":
-                # Infrastructure update
-                infra_id = topic_parts[2]
-                self.infrastructure[infra_id] = message
-                socketio.emit('infrastructure_update', message)
-                
-            elif topic_parts[1] == "emergency":
-                # Emergency broadcast
-                self.emergencies.append(message)
-                socketio.emit('emergency_alert', message)
-                
-            elif topic_parts[1] == "jobs":
-                # Job response
-                job_id = topic_parts[2]
-                if job_id in self.jobs:
-                    self.jobs[job_id]['responses'] = self.jobs[job_id].get('responses', [])
-                    self.jobs[job_id]['responses'].append(message)
-                    socketio.emit('job_response', {
-                        'job_id': job_id,
-                        'response': message
-                    })
-                    
-        except Exception as e:
-            print(f"Error processing MQTT message: {e}")
+            return json_loads(msg.payload)
+        except ValueError as e:
+            print(f"Error processing MQTT message on {msg.topic}: {e}")
+            return None
+    
+    def on_vehicle_status(self, client, userdata, msg):
+        """Vehicle status update on v2x/vehicles/{vehicle_id}/status"""
+        message = self.parse_payload(msg)
+        if message is None:
+            return
+        vehicle_id = msg.topic.rsplit('/', 2)[-2]
+        self.vehicles[vehicle_id] = message
+        self.emit_vehicle_update(vehicle_id, message)
+    
+    def on_vehicle_batch(self, client, userdata, msg):
+        """Batched vehicle status updates on v2x/vehicles/batch"""
+        messages = self.parse_payload(msg)
+        if messages is None:
+            return
+        for message in messages:
+            vehicle_id = message['vehicle_id']
+            self.vehicles[vehicle_id] = message
+            self.emit_vehicle_update(vehicle_id, message)
+    
+    def on_vehicle_emergency(self, client, userdata, msg):
+        """Vehicle emergency on v2x/vehicles/{vehicle_id}/emergency"""
+        message = self.parse_payload(msg)
+        if message is None:
+            return
+        socketio.emit('vehicle_emergency', {
+            'vehicle_id': msg.topic.rsplit('/', 2)[-2],
+            'message': message
+        })
+    
+    def on_infrastructure_update(self, client, userdata, msg):
+        """Infrastructure update on v2x/infrastructure/{infra_id}"""
+        message = self.parse_payload(msg)
+        if message is None:
+            return
+        self.infrastructure[msg.topic.rsplit('/', 1)[-1]] = message
+        socketio.emit('infrastructure_update', message)
+    
+    def on_emergency_broadcast(self, client, userdata, msg):
+        """Emergency broadcast on v2x/emergency/broadcast"""
+        message = self.parse_payload(msg)
+        if message is None:
+            return
+        self.emergencies.append(message)
+        socketio.emit('emergency_alert', message)
+    
+    def on_job_response(self, client, userdata, msg):
+        """Job response on v2x/jobs/{job_id}/response"""
+        message = self.parse_payload(msg)
+        if message is None:
+            return
+        job_id = msg.topic.rsplit('/', 2)[-2]
+        if job_id in self.jobs:
+            responses = self.jobs[job_id].setdefault('responses', [])
+            responses.append(message)
+            if len(responses) > MAX_JOB_RESPONSES:
+                del responses[0]
+            socketio.emit('job_response', {
+                'job_id': job_id,
+                'response': message
+            })
+    
+    def recent_emergencies(self, count: int = 10) -> List[Dict[str, Any]]:
+        """Return the last `count` emergencies, oldest first"""
+        return list(islice(reversed(self.emergencies), count))[::-1]
+    
+    def emit_vehicle_update(self, vehicle_id: str, message: Dict[str, Any]):
+        """Emit only the fields that changed since the last update, at most
+        once per VEHICLE_UPDATE_INTERVAL per vehicle"""
+        now = time.monotonic()
+        if now - self._last_emit_time.get(vehicle_id, 0.0) < VEHICLE_UPDATE_INTERVAL:
+            return
+        
+        snapshot = self._last_emitted.get(vehicle_id, {})
+        delta = {k: v for k, v in message.items() if snapshot.get(k) != v}
+        if not delta:
+            return
+        delta['vehicle_id'] = vehicle_id
+        
+        self._last_emitted[vehicle_id] = message
+        self._last_emit_time[vehicle_id] = now
+        socketio.emit('vehicle_update', delta)
     
     def connect_mqtt(self):
         """Connect to MQTT broker"""
@@ -108,22 +209,26 @@ class Car2XDashboard:
     
     def create_job(self, job_type: str, target_vehicles: List[str], parameters: Dict[str, Any] = None):
         """Create and distribute a job"""
-        import uuid
         job_id = str(uuid.uuid4())[:8]
         
         job = {
             "job_id": job_id,
             "type": job_type,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": time.time_ns() // 1_000_000,  # epoch ms
             "target_vehicles": target_vehicles,
             "parameters": parameters or {},
             "status": "pending"
         }
         
         self.jobs[job_id] = job
+        if len(self.jobs) > MAX_JOBS:
+            # Dicts keep insertion order, so the first key is the oldest job
+            del self.jobs[next(iter(self.jobs))]
         
-        # Publish job to MQTT
-        self.mqtt_client.publish(f"v2x/jobs/{job_id}/assign", json.dumps(job))
+        # Publish job to MQTT. With loop_start() running, paho only queues the
+        # packet here and its network thread does the socket write, so QoS 0
+        # lets the request return without waiting for a broker acknowledgement.
+        self.mqtt_client.publish(f"v2x/jobs/{job_id}/assign", json_dumps(job), qos=0)
         
         return job_id
 
@@ -148,7 +253,7 @@ def get_infrastructure():
 @app.route('/api/emergencies')
 def get_emergencies():
     """Get recent emergencies"""
-    return jsonify(dashboard.emergencies[-10:])  # Last 10 emergencies
+    return jsonify(dashboard.recent_emergencies())  # Last 10 emergencies
 
 @app.route('/api/jobs')
 def get_jobs():
@@ -183,7 +288,7 @@ def handle_data_request():
     emit('initial_data', {
         'vehicles': dashboard.vehicles,
         'infrastructure': dashboard.infrastructure,
-        'emergencies': dashboard.emergencies[-10:],
+        'emergencies': dashboard.recent_emergencies(),
         'jobs': dashboard.jobs
     })
 
@@ -31,11 +31,11 @@ async def broker_coro():
     print("MQTT Broker started on port 1883")
     print("Press Ctrl+C to stop")
     
-    # Keep the broker running
+    # Keep the broker running; waiting on an event that is never set parks
+    # the coroutine without waking the event loop until it is cancelled
     try:
-        while True:
-            await asyncio.sleep(1)
-    except KeyboardInterrupt:
+        await asyncio.Event().wait()
+    except (KeyboardInterrupt, asyncio.CancelledError):
         print("\nStopping MQTT Broker...")
     finally:
         await broker.shutdown()
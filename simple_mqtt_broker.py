@@ -4,20 +4,30 @@ Simple MQTT Broker using mosquitto command
 This script helps you start the mosquitto broker easily
 """
 
+import functools
+import shutil
 import subprocess
 import sys
 import os
 
+@functools.lru_cache(maxsize=None)
 def find_mosquitto():
     """Try to find mosquitto executable"""
+    # Anything on PATH is found without spawning a process
+    path = shutil.which("mosquitto")
+    if path:
+        return path
+    
     common_paths = [
-        "mosquitto",
         "C:\\Program Files\\mosquitto\\mosquitto.exe",
         "C:\\Program Files (x86)\\mosquitto\\mosquitto.exe",
         os.path.expanduser("~/mosquitto/mosquitto.exe"),
     ]
     
     for path in common_paths:
+        # Only run the (slow) --help check on files that actually exist
+        if not os.path.isfile(path):
+            continue
         try:
             # Test if mosquitto exists
             result = subprocess.run([path, "--help"], 
@@ -25,7 +35,7 @@ def find_mosquitto():
                                   timeout=2)
             if result.returncode == 0 or "mosquitto" in result.stdout.decode().lower():
                 return path
-        except:
+        except (OSError, subprocess.TimeoutExpired):
             continue
     
     return None
@@ -3,6 +3,7 @@ class Car2XDashboard {
     constructor() {
         this.socket = io();
         this.map = null;
+        this.vehicles = {};
         this.vehicleMarkers = {};
         this.emergencyMarkers = {};
         this.infrastructureMarkers = {};
@@ -81,7 +82,12 @@ class Car2XDashboard {
             this.updateStatistics();
         });
         
-        this.socket.on('vehicle_update', (vehicle) => {
+        this.socket.on('vehicle_update', (delta) => {
+            // The server only sends the fields that changed; merge them into
+            // the last known state of the vehicle. Vehicles without a full
+            // record yet are seeded by initial_data or polling instead.
+            if (!this.vehicles[delta.vehicle_id]) return;
+            const vehicle = Object.assign(this.vehicles[delta.vehicle_id], delta);
             this.updateVehicle(vehicle);
             this.updateVehicleMarker(vehicle);
         });
@@ -169,12 +175,14 @@ class Car2XDashboard {
         vehiclesList.innerHTML = '';
         
         Object.values(vehicles).forEach(vehicle => {
+            this.vehicles[vehicle.vehicle_id] = vehicle;
             this.addVehicleCard(vehicle);
             this.updateVehicleMarker(vehicle);
         });
     }
     
     updateVehicle(vehicle) {
+        this.vehicles[vehicle.vehicle_id] = vehicle;
         const existingCard = document.querySelector(`[data-vehicle-id="${vehicle.vehicle_id}"]`);
         if (existingCard) {
             this.updateVehicleCard(vehicle, existingCard);
@@ -521,7 +529,7 @@ class Car2XDashboard {
             const newJob = {
                 job_id: data.job_id,
                 type: jobType,
-                timestamp: new Date().toISOString(),
+                timestamp: Date.now(),
                 target_vehicles: selectedVehicles,
                 parameters: parsedParameters,
                 status: 'pending'
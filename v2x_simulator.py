@@ -5,31 +5,89 @@ Simulates V2X communication using MQTT for vehicle-to-vehicle and vehicle-to-inf
 """
 
 import json
+import logging
+import math
 import time
 import random
+import sched
+import socket
 import threading
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import paho.mqtt.client as mqtt
 from typing import Dict, List, Any
 import uuid
 
+# Optional: orjson is a much faster drop-in for the stdlib json module.
+# Both loads() accept bytes, so MQTT payloads never need decoding first.
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+    
+    def json_dumps(obj):
+        # Match orjson's output: compact UTF-8 bytes
+        return json.dumps(obj, separators=(',', ':')).encode()
+
+logger = logging.getLogger(__name__)
+
+def epoch_ms() -> int:
+    """Current time as integer milliseconds since the Unix epoch, the
+    timestamp format used in all V2X messages"""
+    return time.time_ns() // 1_000_000
+
+# Approximate length of one degree of latitude in meters
+METERS_PER_DEGREE = 111320.0
+# Vehicles turn back when they drift this far (in degrees) from the base position
+SIMULATION_AREA_DEG = 0.02
+
 class V2XSimulator:
-    def __init__(self, broker_host="localhost", broker_port=1883):
+    def __init__(self, broker_host="localhost", broker_port=1883, per_vehicle_cam=False):
         self.broker_host = broker_host
         self.broker_port = broker_port
+        # Also publish each CAM on its own v2x/vehicles/{id}/status topic for
+        # subscribers that do not read the batched topic
+        self.per_vehicle_cam = per_vehicle_cam
         self.client = mqtt.Client()
+        # Telemetry is fire-and-forget at QoS 0; keep paho from throttling
+        # any QoS > 0 traffic at its default window of 20 inflight messages
+        self.client.max_inflight_messages_set(1000)
+        self.client.max_queued_messages_set(0)  # unlimited
         self.running = False
         self.vehicles = {}
         self.infrastructure = {}
         self.jobs = {}
+        # Per-tick random numbers are drawn in batches from this generator
+        self.rng = np.random.default_rng()
+        # Bounded pool for delayed job responses, so bursts of job
+        # assignments do not spawn one thread each
+        self.job_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="job-response")
+        
+        # Handlers for v2x/{category}/{id}/{action} topics, keyed by
+        # (category, action) and called with (id, message)
+        self.topic_handlers = {
+            ("vehicles", "status"): self.handle_vehicle_status,
+            ("vehicles", "emergency"): self.handle_emergency_message,
+            ("jobs", "assign"): self.handle_job_assignment,
+            ("jobs", "response"): self.handle_job_response,
+        }
         
-        # Setup MQTT callbacks
+        # Setup MQTT callbacks. A handler that raises is logged by paho and
+        # the message dropped, instead of stopping the network thread.
+        self.client.suppress_exceptions = True
+        self.client.enable_logger(logger)
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
         
     def on_connect(self, client, userdata, flags, rc):
         print(f"Connected to MQTT broker with result code {rc}")
+        # Send small CAM packets right away instead of letting Nagle's
+        # algorithm hold them back waiting for an ACK
+        client.socket().setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         # Subscribe to vehicle topics
+        client.subscribe("v2x/vehicles/batch")
         client.subscribe("v2x/vehicles/+/status")
         client.subscribe("v2x/vehicles/+/emergency")
         client.subscribe("v2x/jobs/+/assign")
@@ -37,59 +95,83 @@ class V2XSimulator:
         
     def on_message(self, client, userdata, msg):
         try:
-            topic_parts = msg.topic.split('/')
-            message = json.loads(msg.payload.decode())
-            
-            if topic_parts[1] == "vehicles" and topic_parts[3] == "status":
-                vehicle_id = topic_parts[2]
-                self.vehicles[vehicle_id] = message
-                
-            elif topic_parts[1] == "vehicles" and topic_parts[3] == "emergency":
-                vehicle_id = topic_parts[2]
-                self.handle_emergency_message(vehicle_id, message)
-                
-            elif topic_parts[1] == "jobs" and topic_parts[3] == "assign":
-                job_id = topic_parts[2]
-                self.handle_job_assignment(job_id, message)
-                
-            elif topic_parts[1] == "jobs" and topic_parts[3] == "response":
-                job_id = topic_parts[2]
-                self.handle_job_response(job_id, message)
-                
-        except Exception as e:
-            print(f"Error processing message: {e}")
+            message = json_loads(msg.payload)
+        except ValueError as e:
+            logger.warning("Malformed message on %s: %s", msg.topic, e)
+            return
+        
+        if msg.topic == "v2x/vehicles/batch":
+            self.handle_cam_batch(message)
+            return
+        
+        # v2x/{category}/{id}/{action}
+        topic_parts = msg.topic.split('/', 3)
+        if len(topic_parts) == 4:
+            handler = self.topic_handlers.get((topic_parts[1], topic_parts[3]))
+            if handler:
+                handler(topic_parts[2], message)
     
     def start(self):
         """Start the V2X simulator"""
         self.client.connect(self.broker_host, self.broker_port, 60)
+        # loop_start() runs loop_forever() on a dedicated network thread and
+        # registers it with paho, so that thread alone writes to the socket;
+        # publishes from other threads are only queued for it
         self.client.loop_start()
         self.running = True
         
-        # Start simulation threads
-        threading.Thread(target=self.simulate_vehicles, daemon=True).start()
-        threading.Thread(target=self.simulate_infrastructure, daemon=True).start()
-        threading.Thread(target=self.simulate_emergency_events, daemon=True).start()
+        # Start simulation thread
+        threading.Thread(target=self.run_simulations, daemon=True).start()
         
         print("V2X Simulator started")
     
     def stop(self):
         """Stop the V2X simulator"""
         self.running = False
+        self.job_executor.shutdown(wait=False)
         self.client.loop_stop()
         self.client.disconnect()
         print("V2X Simulator stopped")
     
+    def run_simulations(self):
+        """Run all simulations cooperatively on a single thread.
+        
+        Each simulation is a generator that does one tick of work and then
+        yields the number of seconds until its next tick.
+        """
+        scheduler = sched.scheduler(time.monotonic, time.sleep)
+        
+        def step(simulation):
+            try:
+                delay = next(simulation)
+            except StopIteration:
+                return
+            scheduler.enter(delay, 0, step, (simulation,))
+        
+        for simulation in (self.simulate_vehicles(),
+                           self.simulate_infrastructure(),
+                           self.simulate_emergency_events()):
+            scheduler.enter(0, 0, step, (simulation,))
+        
+        scheduler.run()
+    
     def simulate_vehicles(self):
         """Simulate vehicle movement and CAM (Cooperative Awareness Message) generation"""
         vehicle_ids = ["V001", "V002", "V003", "V004", "V005"]
         
         # Initialize vehicle positions (Munich area)
         base_lat, base_lon = 48.1351, 11.5820
+        # Longitude degrees shrink with latitude; the area is small enough
+        # to use the base latitude for every vehicle
+        lon_meters_per_degree = METERS_PER_DEGREE * math.cos(math.radians(base_lat))
         
-        for i, vid in enumerate(vehicle_ids):
-            self.vehicles[vid] = {
+        # Vehicle records have the CAM layout so they can be published as is
+        fleet = []
+        for vid in vehicle_ids:
+            vehicle = {
+                "type": "CAM",
                 "vehicle_id": vid,
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": epoch_ms(),
                 "position": {
                     "latitude": base_lat + random.uniform(-0.01, 0.01),
                     "longitude": base_lon + random.uniform(-0.01, 0.01)
@@ -98,34 +180,44 @@ class V2XSimulator:
                 "heading": random.uniform(0, 360),
                 "status": "normal"
             }
+            self.vehicles[vid] = vehicle
+            fleet.append(vehicle)
+        
+        # Bind names used for every vehicle on every tick to locals
+        cos, sin, radians = math.cos, math.sin, math.radians
+        # Degrees moved per km/h of speed in one 1 s tick
+        lat_per_kmh = 1 / (3.6 * METERS_PER_DEGREE)
+        lon_per_kmh = 1 / (3.6 * lon_meters_per_degree)
         
         while self.running:
-            for vid in vehicle_ids:
-                if vid in self.vehicles:
-                    # Update vehicle position
-                    vehicle = self.vehicles[vid]
-                    vehicle["timestamp"] = datetime.now().isoformat()
-                    
-                    # Simulate movement
-                    speed_kmh = vehicle["speed"]
-                    speed_ms = speed_kmh / 3.6
-                    
-                    # Update position based on speed and heading
-                    heading_rad = vehicle["heading"] * 3.14159 / 180
-                    lat_offset = (speed_ms * 0.00001) * random.uniform(-0.5, 0.5)
-                    lon_offset = (speed_ms * 0.00001) * random.uniform(-0.5, 0.5)
-                    
-                    vehicle["position"]["latitude"] += lat_offset
-                    vehicle["position"]["longitude"] += lon_offset
-                    
-                    # Occasionally change heading
-                    if random.random() < 0.1:
-                        vehicle["heading"] = (vehicle["heading"] + random.uniform(-30, 30)) % 360
-                    
-                    # Publish CAM message
-                    self.publish_cam_message(vehicle)
+            # All CAM messages of one tick share the same timestamp
+            timestamp = epoch_ms()
+            turns = (self.rng.random(len(fleet)) < 0.1).tolist()
+            turn_angles = self.rng.uniform(-30, 30, len(fleet)).tolist()
+            for i, vehicle in enumerate(fleet):
+                vehicle["timestamp"] = timestamp
+                
+                # Move along the heading for one tick (1 s) at the current speed
+                speed = vehicle["speed"]
+                heading_rad = radians(vehicle["heading"])
+                position = vehicle["position"]
+                position["latitude"] += speed * lat_per_kmh * cos(heading_rad)
+                position["longitude"] += speed * lon_per_kmh * sin(heading_rad)
+                
+                # Head back towards the base at the edge of the simulated area
+                dlat = base_lat - position["latitude"]
+                dlon = base_lon - position["longitude"]
+                if abs(dlat) > SIMULATION_AREA_DEG or abs(dlon) > SIMULATION_AREA_DEG:
+                    vehicle["heading"] = math.degrees(math.atan2(
+                        dlon * lon_meters_per_degree, dlat * METERS_PER_DEGREE)) % 360
+                
+                # Occasionally change heading
+                if turns[i]:
+                    vehicle["heading"] = (vehicle["heading"] + turn_angles[i]) % 360
             
-            time.sleep(1)  # Update every second
+            # Publish all CAM messages of this tick at once
+            self.publish_cam_batch(fleet)
+            yield 1  # Update every second
     
     def simulate_infrastructure(self):
         """Simulate infrastructure messages (traffic lights, road signs, etc.)"""
@@ -135,28 +227,39 @@ class V2XSimulator:
             {"id": "TL003", "position": {"lat": 48.1371, "lon": 11.5840}, "state": "yellow"}
         ]
         
+        # Type, id, position and topic of a traffic light never change, so
+        # serialize that part of its V2I message once; each tick only encodes
+        # the changing fields and splices them onto the prefix
+        for tl in traffic_lights:
+            tl["topic"] = f"v2x/infrastructure/{tl['id']}"
+            tl["message_prefix"] = json_dumps({
+                "type": "V2I",
+                "infrastructure_id": tl["id"],
+                "position": tl["position"]
+            })[:-1] + b","
+        
         while self.running:
-            for tl in traffic_lights:
+            timestamp = epoch_ms()
+            state_changes = (self.rng.random(len(traffic_lights)) < 0.05).tolist()  # 5% chance to change state
+            new_states = self.rng.choice(["red", "yellow", "green"], len(traffic_lights)).tolist()
+            remaining_times = self.rng.integers(5, 30, len(traffic_lights), endpoint=True).tolist()
+            for i, tl in enumerate(traffic_lights):
                 # Simulate traffic light state changes
-                if random.random() < 0.05:  # 5% chance to change state
-                    states = ["red", "yellow", "green"]
-                    tl["state"] = random.choice(states)
+                if state_changes[i]:
+                    tl["state"] = new_states[i]
                 
                 # Publish infrastructure message
-                message = {
-                    "type": "V2I",
-                    "infrastructure_id": tl["id"],
-                    "timestamp": datetime.now().isoformat(),
-                    "position": tl["position"],
+                changes = json_dumps({
+                    "timestamp": timestamp,
                     "data": {
                         "traffic_light_state": tl["state"],
-                        "remaining_time": random.randint(5, 30)
+                        "remaining_time": remaining_times[i]
                     }
-                }
+                })
                 
-                self.client.publish(f"v2x/infrastructure/{tl['id']}", json.dumps(message))
+                self.client.publish(tl["topic"], tl["message_prefix"] + changes[1:], qos=0)
             
-            time.sleep(2)  # Update every 2 seconds
+            yield 2  # Update every 2 seconds
     
     def simulate_emergency_events(self):
         """Simulate emergency events and DENM (Decentralized Environmental Notification) messages"""
@@ -169,7 +272,7 @@ class V2XSimulator:
                 emergency_type = random.choice(emergency_types)
                 self.create_emergency_event(emergency_type)
             
-            time.sleep(5)  # Check every 5 seconds
+            yield 5  # Check every 5 seconds
     
     def create_emergency_event(self, event_type: str):
         """Create an emergency event and broadcast DENM message"""
@@ -185,7 +288,7 @@ class V2XSimulator:
         denm_message = {
             "type": "DENM",
             "event_id": event_id,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": epoch_ms(),
             "position": position,
             "event_type": event_type,
             "severity": random.choice(["low", "medium", "high"]),
@@ -194,22 +297,20 @@ class V2XSimulator:
         }
         
         # Broadcast to all vehicles
-        self.client.publish("v2x/emergency/broadcast", json.dumps(denm_message))
-        print(f"Emergency event created: {event_type} at {position}")
+        self.client.publish("v2x/emergency/broadcast", json_dumps(denm_message), qos=0)
+        logger.info("Emergency event created: %s at %s", event_type, position)
     
     def publish_cam_message(self, vehicle: Dict[str, Any]):
         """Publish Cooperative Awareness Message (CAM)"""
-        cam_message = {
-            "type": "CAM",
-            "vehicle_id": vehicle["vehicle_id"],
-            "timestamp": vehicle["timestamp"],
-            "position": vehicle["position"],
-            "speed": vehicle["speed"],
-            "heading": vehicle["heading"],
-            "status": vehicle["status"]
-        }
+        self.client.publish(f"v2x/vehicles/{vehicle['vehicle_id']}/status", json_dumps(vehicle), qos=0)
+    
+    def publish_cam_batch(self, cam_messages: List[Dict[str, Any]]):
+        """Publish a list of CAM messages as a single MQTT message"""
+        self.client.publish("v2x/vehicles/batch", json_dumps(cam_messages), qos=0)
         
-        self.client.publish(f"v2x/vehicles/{vehicle['vehicle_id']}/status", json.dumps(cam_message))
+        if self.per_vehicle_cam:
+            for cam_message in cam_messages:
+                self.publish_cam_message(cam_message)
     
     def create_job(self, job_type: str, target_vehicles: List[str], parameters: Dict[str, Any] = None):
         """Create a job and distribute it to target vehicles"""
@@ -218,7 +319,7 @@ class V2XSimulator:
         job = {
             "job_id": job_id,
             "type": job_type,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": epoch_ms(),
             "target_vehicles": target_vehicles,
             "parameters": parameters or {},
             "status": "pending"
@@ -226,46 +327,57 @@ class V2XSimulator:
         
         self.jobs[job_id] = job
         
-        # Distribute job to target vehicles
-        for vehicle_id in target_vehicles:
-            self.client.publish(f"v2x/jobs/{job_id}/assign", json.dumps(job))
+        # Distribute job to target vehicles. The assignment lists its targets
+        # and every vehicle subscribes to v2x/jobs/+/assign, so one publish
+        # reaches all of them.
+        self.client.publish(f"v2x/jobs/{job_id}/assign", json_dumps(job), qos=0)
         
-        print(f"Job created: {job_type} for vehicles {target_vehicles}")
+        logger.info("Job created: %s for vehicles %s", job_type, target_vehicles)
         return job_id
     
+    def handle_cam_batch(self, cam_messages: List[Dict[str, Any]]):
+        """Handle a batch of CAM messages published in one tick"""
+        for cam_message in cam_messages:
+            self.handle_vehicle_status(cam_message["vehicle_id"], cam_message)
+    
+    def handle_vehicle_status(self, vehicle_id: str, message: Dict[str, Any]):
+        """Handle vehicle status (CAM) messages"""
+        self.vehicles[vehicle_id] = message
+    
     def handle_emergency_message(self, vehicle_id: str, message: Dict[str, Any]):
         """Handle emergency messages from vehicles"""
-        print(f"Emergency from {vehicle_id}: {message}")
+        logger.info("Emergency from %s: %s", vehicle_id, message)
     
     def handle_job_assignment(self, job_id: str, job_data: Dict[str, Any]):
         """Handle job assignments and simulate vehicle responses"""
-        print(f"Job {job_id} assigned to vehicles")
+        logger.info("Job %s assigned to vehicles", job_id)
         
         # Simulate vehicle responses after a short delay
         def send_responses():
             time.sleep(2)  # Wait 2 seconds before responding
+            timestamp = epoch_ms()
             for vehicle_id in job_data.get('target_vehicles', []):
                 response = {
                     "job_id": job_id,
                     "vehicle_id": vehicle_id,
                     "status": "acknowledged",
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": timestamp,
                     "message": f"Job received and processing"
                 }
-                self.client.publish(f"v2x/jobs/{job_id}/response", json.dumps(response))
-                print(f"Vehicle {vehicle_id} responded to job {job_id}")
+                self.client.publish(f"v2x/jobs/{job_id}/response", json_dumps(response), qos=0)
+                logger.info("Vehicle %s responded to job %s", vehicle_id, job_id)
         
-        # Start response thread
-        threading.Thread(target=send_responses, daemon=True).start()
+        self.job_executor.submit(send_responses)
     
     def handle_job_response(self, job_id: str, response: Dict[str, Any]):
         """Handle job responses from vehicles"""
         if job_id in self.jobs:
             self.jobs[job_id]["responses"] = self.jobs[job_id].get("responses", [])
             self.jobs[job_id]["responses"].append(response)
-            print(f"Job {job_id} response: {response}")
+            logger.info("Job %s response: %s", job_id, response)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     simulator = V2XSimulator()
     
     try: